@@ -2,13 +2,14 @@
 Provides helper functions for angle operations not supported by numpy
 """
 
+import math
 from typing import Union
 
 import numpy as np
 
 
 def wrap_to_pi(angle: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
-    """Wraps angles to the range (-pi,pi]
+    """Wraps angles to the range [-pi,pi)
 
     INPUTS:
         angle: either single angle or numpy array of angles (in radians)
@@ -16,8 +17,14 @@ def wrap_to_pi(angle: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
     OUTPUTS:
         angle: either single angle or numpy array of angles (in radians), but wrapped
 
-    But this will wrap the value pi to -pi.
+    Single angles use math.remainder, which is a single correctly-rounded C call, and
+    arrays are wrapped with numpy. Both wrap the value pi to -pi, matching the
+    compiled kernels.
     """
 
-    newAngle = (angle + np.pi) % (2 * np.pi) - np.pi
+    if not isinstance(angle, np.ndarray):
+        newAngle = math.remainder(angle, math.tau)
+        return -math.pi if newAngle == math.pi else newAngle
+
+    newAngle = np.remainder(angle + np.pi, 2 * np.pi) - np.pi
     return newAngle
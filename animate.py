@@ -29,14 +29,12 @@ def animate_simulation(
     traj_handles, vel_handles, vel_comd_handles = [], [], []
 
     for swimmer in swimmers:
-        traj_handles.append(
-            ax.plot(swimmer.pose_hist[0, 1], swimmer.pose_hist[0, 2])[0]
-        )
+        traj_handles.append(ax.plot(swimmer.x[0], swimmer.y[0])[0])
 
         # vel_handles.append(
         #     ax.quiver(
-        #         swimmer.pose_hist[0, 1],
-        #         swimmer.pose_hist[0, 2],
+        #         swimmer.x[0],
+        #         swimmer.y[0],
         #         swimmer.vel_flow_hist[0, 1],
         #         swimmer.vel_flow_hist[0, 2],
         #         color="blue",
@@ -44,10 +42,10 @@ def animate_simulation(
         # )
         vel_comd_handles.append(
             ax.plot(
-                swimmer.pose_hist[0, 1],
-                swimmer.pose_hist[0, 2],
-                swimmer.pose_hist[0, 1] + arrow_scale * swimmer.vel_comd_hist[0, 1],
-                swimmer.pose_hist[0, 2] + arrow_scale * swimmer.vel_comd_hist[0, 2],
+                swimmer.x[0],
+                swimmer.y[0],
+                swimmer.x[0] + arrow_scale * swimmer.vel_comd_hist[0, 1],
+                swimmer.y[0] + arrow_scale * swimmer.vel_comd_hist[0, 2],
                 color="green",
             )[0]
         )
@@ -62,7 +60,7 @@ def animate_simulation(
     ii = 1
     while ii < iterations:
 
-        t = swimmers[0].pose_hist[ii, 0]
+        t = swimmers[0].t[ii]
 
         if time.perf_counter() - t_start < t:
             continue
@@ -70,24 +68,22 @@ def animate_simulation(
         ax.set_title(f"$t = {t:0.2}$ [s]")
 
         for swimmer, traj, vel_comd in zip(swimmers, traj_handles, vel_comd_handles):
-            traj.set_xdata(swimmer.pose_hist[0:ii, 1])
-            traj.set_ydata(swimmer.pose_hist[0:ii, 2])
+            traj.set_xdata(swimmer.x[0:ii])
+            traj.set_ydata(swimmer.y[0:ii])
 
             vel_comd.set_xdata(
                 np.array(
                     (
-                        swimmer.pose_hist[ii, 1],
-                        swimmer.pose_hist[ii, 1]
-                        + arrow_scale * swimmer.vel_comd_hist[ii, 1],
+                        swimmer.x[ii],
+                        swimmer.x[ii] + arrow_scale * swimmer.vel_comd_hist[ii, 1],
                     )
                 )
             )
             vel_comd.set_ydata(
                 np.array(
                     (
-                        swimmer.pose_hist[ii, 2],
-                        swimmer.pose_hist[ii, 2]
-                        + arrow_scale * swimmer.vel_comd_hist[ii, 2],
+                        swimmer.y[ii],
+                        swimmer.y[ii] + arrow_scale * swimmer.vel_comd_hist[ii, 2],
                     )
                 )
             )
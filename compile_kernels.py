@@ -0,0 +1,22 @@
+"""
+Compiles the Numba kernels ahead of running simulations and stores them in Numba's
+on-disk cache, so that neither the first simulation nor any worker process has to
+wait for compilation. Run once after installing or modifying kernels.py:
+
+    python compile_kernels.py
+"""
+
+import time
+
+import kernels
+from swimmer import POSE_DTYPE
+
+
+def main():
+    time_start = time.perf_counter()
+    kernels.compile_rankine(POSE_DTYPE)
+    print(f"Kernels compiled in {time.perf_counter() - time_start:0.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@
 Defines controllers for Flow-Based Rendezvous and Docking (FBRD) and Naive approach.
 """
 
+import math
+from typing import Tuple
+
 import numpy as np
 
 import anglefunctions
@@ -15,6 +18,7 @@ class FBRDController:
     """
 
     time_to_convergence = 2  # [s]
+    convergence_checks = 10  # Convergence checks per time_to_convergence
     convergence_threshold = 0.075  # [m]
 
     def __init__(
@@ -38,11 +42,18 @@ class FBRDController:
 
         # Data to store
         self.convergence_count = 0
+        self.time_step = time_step
         self.convergence_count_threshold = self.time_to_convergence / time_step
+        self.check_interval = max(
+            1, int(self.convergence_count_threshold // self.convergence_checks)
+        )
+        self.convergence_threshold_sq = self.convergence_threshold**2
         self.r_diff = np.inf
         self.theta_diff = np.inf
 
-    def get_control_vel(self, pos: np.ndarray, targ: np.ndarray) -> np.ndarray:
+    def get_control_vel(
+        self, pos: np.ndarray, targ: np.ndarray
+    ) -> Tuple[Tuple[float, float, float], float]:
         """
         Gets the velocity to apply to the mobile boat. The controller looks like:
 
@@ -51,11 +62,12 @@ class FBRDController:
         and the applied velocity is either out or in along the phase direction.
 
         Inputs:
-            pos: numpy [x, y, theta] pose of the mobile swimmer
-            targ: numpy [x, y, theta] pose of the target swimmer
+            pos: [x, y] or [x, y, theta] pose of the mobile swimmer
+            targ: [x, y] or [x, y, theta] pose of the target swimmer
 
         Outputs:
             control_vel: [dx, dy, dtheta] velocity to apply to the mobile boat.
+            cost: distance traveled as a result of the control input over one step.
 
         """
 
@@ -81,31 +93,76 @@ class FBRDController:
         # print(f"{dir=} {r_targ=} {r_des=: 0.3} {r_mob=: 0.3}")
         # print()
 
-        control_vel = (
-            dir
-            * self.vel_from_thrusters
-            * np.array((np.cos(theta_mob), np.sin(theta_mob), 0))
-        )
+        speed = dir * self.vel_from_thrusters
+        control_vel = (speed * math.cos(theta_mob), speed * math.sin(theta_mob), 0.0)
+        cost = abs(speed) * self.time_step
 
         # Store data
         self.pos = pos
         self.targ = targ
-        self.r_diff = r_targ - r_mob
-        self.theta_diff = err
+        self.r_diff = float(r_targ - r_mob)
+        self.theta_diff = float(err)
+
+        return control_vel, cost
+
+    def get_control_vel_batch(
+        self, pos: np.ndarray, targ: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the velocities to apply to many mobile boats at once, using the same
+        control law as get_control_vel(). No data is stored.
+
+        Inputs:
+            pos: numpy N x [x, y] positions of the mobile swimmers
+            targ: numpy N x [x, y] positions of the target swimmers
+
+        Outputs:
+            control_vel: N x [dx, dy, dtheta] velocities to apply to the mobile boats.
+            cost: N distances traveled as a result of the control inputs over one step.
+
+        """
+
+        r_mob, theta_mob = self.flow_model.get_state(pos)
+        r_targ, theta_targ = self.flow_model.get_state(targ)
+
+        err = anglefunctions.wrap_to_pi(theta_targ - theta_mob) * self.flow_ori.value
+
+        r_des = r_targ + self.Kp * err * self.flow_dir.value
+
+        # Controller is OFF within the radius tolerance
+        dir = np.where(r_des > r_mob, 1.0, -1.0)
+        dir[np.abs(r_des - r_mob) < self.tolerance] = 0.0
 
-        return control_vel
+        speed = dir * self.vel_from_thrusters
+        control_vel = np.zeros((pos.shape[0], 3))
+        control_vel[:, 0] = speed * np.cos(theta_mob)
+        control_vel[:, 1] = speed * np.sin(theta_mob)
+
+        return control_vel, np.abs(speed) * self.time_step
 
     def evaluate_convergence(self) -> bool:
+        """
+        Checks whether the boats have stayed within the convergence threshold for
+        time_to_convergence. Meant to be called once every check_interval steps.
+        """
 
-        total_err = np.linalg.norm(self.pos - self.targ)
-        # total_err = np.sqrt(self.r_diff**2 + self.theta_diff**2)
+        # Compare squared distances to avoid the square root
+        dx = float(self.pos[0] - self.targ[0])
+        dy = float(self.pos[1] - self.targ[1])
+        total_err_sq = dx * dx + dy * dy
+        # total_err_sq = self.r_diff * self.r_diff + self.theta_diff * self.theta_diff
 
-        if total_err <= self.convergence_threshold:
-            self.convergence_count += 1
+        if total_err_sq <= self.convergence_threshold_sq:
+            self.convergence_count += self.check_interval
         else:
             self.convergence_count = 0
 
-        return self.convergence_count >= self.convergence_count_threshold
+        # The first converged check is credited with check_interval steps that were
+        #   not observed, so require one more interval than the threshold.
+        return (
+            self.convergence_count
+            >= self.convergence_count_threshold + self.check_interval
+        )
 
 
 class NaiveController:
@@ -114,6 +171,7 @@ class NaiveController:
     """
 
     time_to_convergence = 2  # [s]
+    convergence_checks = 10  # Convergence checks per time_to_convergence
     convergence_threshold = 0.05  # [m]
 
     def __init__(
@@ -137,11 +195,18 @@ class NaiveController:
 
         # Data to store
         self.convergence_count = 0
+        self.time_step = time_step
         self.convergence_count_threshold = self.time_to_convergence / time_step
+        self.check_interval = max(
+            1, int(self.convergence_count_threshold // self.convergence_checks)
+        )
+        self.convergence_threshold_sq = self.convergence_threshold**2
         self.r_diff = np.inf
         self.theta_diff = np.inf
 
-    def get_control_vel(self, pos: np.ndarray, targ: np.ndarray) -> np.ndarray:
+    def get_control_vel(
+        self, pos: np.ndarray, targ: np.ndarray
+    ) -> Tuple[Tuple[float, float, float], float]:
         """
         Gets the velocity to apply to the mobile boat. The controller looks like:
 
@@ -150,11 +215,12 @@ class NaiveController:
         and the applied velocity is either out or in along the phase direction.
 
         Inputs:
-            pos: numpy [x, y, theta] pose of the mobile swimmer
-            targ: numpy [x, y, theta] pose of the target swimmer
+            pos: [x, y] or [x, y, theta] pose of the mobile swimmer
+            targ: [x, y] or [x, y, theta] pose of the target swimmer
 
         Outputs:
             control_vel: [dx, dy, dtheta] velocity to apply to the mobile boat.
+            cost: distance traveled as a result of the control input over one step.
 
         """
 
@@ -163,29 +229,69 @@ class NaiveController:
 
         err = anglefunctions.wrap_to_pi(theta_targ - theta_mob) * self.flow_ori.value
 
-        vec_to_targ = targ - pos
-        head_to_targ = np.arctan2(vec_to_targ[1], vec_to_targ[0])
+        head_to_targ = math.atan2(targ[1] - pos[1], targ[0] - pos[0])
 
-        control_vel = self.vel_from_thrusters * np.array(
-            (np.cos(head_to_targ), np.sin(head_to_targ), 0)
+        control_vel = (
+            self.vel_from_thrusters * math.cos(head_to_targ),
+            self.vel_from_thrusters * math.sin(head_to_targ),
+            0.0,
         )
+        cost = self.vel_from_thrusters * self.time_step
 
         # Store data
-        self.r_diff = r_targ - r_mob
-        self.theta_diff = err
+        self.r_diff = float(r_targ - r_mob)
+        self.theta_diff = float(err)
         self.pos = pos
         self.targ = targ
 
-        return control_vel
+        return control_vel, cost
+
+    def get_control_vel_batch(
+        self, pos: np.ndarray, targ: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the velocities to apply to many mobile boats at once, using the same
+        control law as get_control_vel(). No data is stored.
+
+        Inputs:
+            pos: numpy N x [x, y] positions of the mobile swimmers
+            targ: numpy N x [x, y] positions of the target swimmers
+
+        Outputs:
+            control_vel: N x [dx, dy, dtheta] velocities to apply to the mobile boats.
+            cost: N distances traveled as a result of the control inputs over one step.
+
+        """
+
+        head_to_targ = np.arctan2(targ[:, 1] - pos[:, 1], targ[:, 0] - pos[:, 0])
+
+        control_vel = np.zeros((pos.shape[0], 3))
+        control_vel[:, 0] = self.vel_from_thrusters * np.cos(head_to_targ)
+        control_vel[:, 1] = self.vel_from_thrusters * np.sin(head_to_targ)
+        cost = np.full(pos.shape[0], self.vel_from_thrusters * self.time_step)
+
+        return control_vel, cost
 
     def evaluate_convergence(self) -> bool:
+        """
+        Checks whether the boats have stayed within the convergence threshold for
+        time_to_convergence. Meant to be called once every check_interval steps.
+        """
 
-        total_err = np.linalg.norm(self.pos - self.targ)
-        # total_err = np.sqrt(self.r_diff**2 + self.theta_diff**2)
+        # Compare squared distances to avoid the square root
+        dx = float(self.pos[0] - self.targ[0])
+        dy = float(self.pos[1] - self.targ[1])
+        total_err_sq = dx * dx + dy * dy
+        # total_err_sq = self.r_diff * self.r_diff + self.theta_diff * self.theta_diff
 
-        if total_err <= self.convergence_threshold:
-            self.convergence_count += 1
+        if total_err_sq <= self.convergence_threshold_sq:
+            self.convergence_count += self.check_interval
         else:
             self.convergence_count = 0
 
-        return self.convergence_count >= self.convergence_count_threshold
+        # The first converged check is credited with check_interval steps that were
+        #   not observed, so require one more interval than the threshold.
+        return (
+            self.convergence_count
+            >= self.convergence_count_threshold + self.check_interval
+        )
@@ -1,3 +1,4 @@
+import math
 from enum import Enum
 from functools import partial
 from typing import Tuple
@@ -69,6 +70,31 @@ class GyreFlow:
 
         return dxs
 
+    def flow_func_scalar(self, x: float, y: float) -> Tuple[float, float, float]:
+        """
+        Calls the flow function at a single point and adds noise, returning a tuple
+        rather than an array. Noise is drawn as scalars, in the same sequence as
+        flow_func(), and is skipped entirely if its parameters are zero.
+
+        Inputs:
+            x, y: coordinates of the point at which to evaluate
+
+        Outputs:
+            dx1, dx2, dtheta: flow velocity at the point with noise added in
+        """
+
+        dx1, dx2, dtheta = self.flow_func_before_noise((x, y))
+
+        mu, sigma = self.noise_params[0], self.noise_params[1]
+        if mu == 0 and sigma == 0:
+            return dx1, dx2, dtheta
+
+        return (
+            dx1 + np.random.normal(mu, sigma),
+            dx2 + np.random.normal(mu, sigma),
+            dtheta + np.random.normal(mu, sigma),
+        )
+
     def noise(self, dxs: np.ndarray) -> np.ndarray:
         """
         Returns Gaussian noise on the flow parameters
@@ -117,7 +143,7 @@ class GyreFlow:
         assuming it is centered at 0.
 
         Inputs:
-            pos: numpy array [x,y,theta] or N x [x,y,theta]
+            pos: [x,y,theta] or [x,y] sequence, or numpy array N x [x,y,theta]
 
         Outputs:
             r: radii from center
@@ -125,10 +151,12 @@ class GyreFlow:
 
         """
 
-        if len(pos.shape) == 1:
-            pos_from_center = pos[0:2] - self.center
-            r = np.sqrt(pos_from_center[0] ** 2 + pos_from_center[1] ** 2)
-            theta = np.arctan2(pos_from_center[1], pos_from_center[0])
+        if not isinstance(pos, np.ndarray) or len(pos.shape) == 1:
+            # Single positions are handled with scalar math to avoid temporaries
+            dx = pos[0] - self.center[0]
+            dy = pos[1] - self.center[1]
+            r = math.sqrt(dx * dx + dy * dy)
+            theta = math.atan2(dy, dx)
         else:
             pos_from_center = pos[:, 0:2] - self.center
             # r = np.sqrt(pos_from_center[:, 0] ** 2 + pos_from_center[:, 1] ** 2)
@@ -0,0 +1,532 @@
+"""
+Numba-compiled kernels for simulating swimmers in a Rankine vortex.
+
+The GyreFlow, Swimmer, and controller classes remain the reference implementation.
+The free functions here reproduce them on raw arrays and scalars so that the
+entire time loop can be compiled, avoiding Python overhead on every step.
+"""
+
+import math
+from typing import Tuple
+
+import numpy as np
+from numba import njit
+
+# Controller identifiers understood by simulate_rankine()
+CONTROLLER_FBRD = 0
+CONTROLLER_NAIVE = 1
+
+
+@njit(cache=True, fastmath=True)
+def rankine_flow_at_radius(
+    x: float, y: float, r: float, a: float, omega_scale: float, omega_core: float
+) -> tuple:
+    """
+    Rankine vortex velocity at a single point, matching flowfield.rankine_vortex.
+    Takes the radius of the point as well so it can be shared with the controller,
+    and the constants of the vortex precomputed by rankine_constants().
+
+    Inputs:
+        x, y: position at which to evaluate
+        r: distance of (x, y) from the vortex center
+        a: radius of the vortex core
+        omega_scale: Gamma / (2 pi)
+        omega_core: Gamma / (2 pi a^2), the angular velocity inside the core
+
+    Outputs:
+        dx, dy: flow velocity at the point
+    """
+
+    if r <= a:
+        k = omega_core
+    else:
+        k = omega_scale / (r * r)
+
+    return -k * y, k * x
+
+
+@njit(cache=True, fastmath=True)
+def rankine_constants(Gamma: float, a: float) -> tuple:
+    """Returns (omega_scale, omega_core) for rankine_flow_at_radius()"""
+
+    omega_scale = Gamma / (2 * math.pi)
+
+    return omega_scale, omega_scale / (a * a)
+
+
+@njit(cache=True, fastmath=True)
+def rk2_rankine_flow(
+    x: float,
+    y: float,
+    vx: float,
+    vy: float,
+    dt: float,
+    a: float,
+    omega_scale: float,
+    omega_core: float,
+) -> tuple:
+    """
+    Rankine vortex velocity at the midpoint of an explicit midpoint (RK2) step.
+    Advancing by this velocity over the whole step is second-order accurate, rather
+    than first-order for the velocity at the start of the step.
+
+    Inputs:
+        x, y: position at the start of the step
+        vx, vy: total velocity at the start of the step
+        dt: duration of the step
+        a, omega_scale, omega_core: see rankine_flow_at_radius()
+    """
+
+    x_mid = x + 0.5 * dt * vx
+    y_mid = y + 0.5 * dt * vy
+
+    return rankine_flow_at_radius(
+        x_mid,
+        y_mid,
+        math.sqrt(x_mid * x_mid + y_mid * y_mid),
+        a,
+        omega_scale,
+        omega_core,
+    )
+
+
+@njit(cache=True, fastmath=True)
+def get_state(x: float, y: float, center_x: float, center_y: float) -> tuple:
+    """Gets the state (r, theta) of a single point, matching GyreFlow.get_state"""
+
+    dx = x - center_x
+    dy = y - center_y
+
+    return math.sqrt(dx * dx + dy * dy), math.atan2(dy, dx)
+
+
+@njit(cache=True, fastmath=True)
+def update_swimmer(
+    x_hist: np.ndarray,
+    y_hist: np.ndarray,
+    th_hist: np.ndarray,
+    vel_flow_hist: np.ndarray,
+    vel_comd_hist: np.ndarray,
+    life: int,
+    x: float,
+    y: float,
+    th: float,
+    dt: float,
+    vx: float,
+    vy: float,
+    vth: float,
+    cont_vx: float,
+    cont_vy: float,
+) -> Tuple[float, float, float]:
+    """
+    Advances a swimmer by one step, matching Swimmer.update. The time columns of
+    the histories are left to fill_times().
+
+    Inputs:
+        x_hist, y_hist, th_hist: the swimmer's pose history
+        vel_flow_hist, vel_comd_hist: the swimmer's velocity histories
+        life: index of the current pose in the histories
+        x, y, th: current pose in full precision
+        dt: time since the current pose
+        vx, vy, vth: flow velocity [xdot, ydot, thetadot]
+        cont_vx, cont_vy: velocity imparted by a controller [xdot, ydot]
+
+    Outputs:
+        x, y, th: the new pose in full precision
+    """
+
+    vel_flow_hist[life, 1] = vx
+    vel_flow_hist[life, 2] = vy
+    vel_flow_hist[life, 3] = vth
+    vel_comd_hist[life, 1] = cont_vx
+    vel_comd_hist[life, 2] = cont_vy
+
+    x += (vx + cont_vx) * dt
+    y += (vy + cont_vy) * dt
+    th += vth * dt
+
+    x_hist[life + 1] = x
+    y_hist[life + 1] = y
+    th_hist[life + 1] = th
+
+    return x, y, th
+
+
+@njit(cache=True, fastmath=True)
+def fill_times(
+    t_hist: np.ndarray,
+    vel_flow_hist: np.ndarray,
+    vel_comd_hist: np.ndarray,
+    life: int,
+    timestep: float,
+) -> None:
+    """
+    Fills the time columns of a swimmer's histories up to life in one pass. Step ii
+    happens at timestep * ii, as in simulation.run_simulation.
+    """
+
+    for ii in range(1, life + 1):
+        t = timestep * ii
+        t_hist[ii] = t
+        vel_flow_hist[ii - 1, 0] = t
+        vel_comd_hist[ii - 1, 0] = t
+
+
+@njit(cache=True, fastmath=True)
+def fbrd_control_vel(
+    r_mob: float,
+    theta_mob: float,
+    r_targ: float,
+    theta_targ: float,
+    flow_ori: int,
+    flow_dir: int,
+    Kp: float,
+    vel_from_thrusters: float,
+    tolerance: float,
+) -> tuple:
+    """
+    Control velocity of the FBRD controller, matching FBRDController.get_control_vel.
+
+    Outputs:
+        dx, dy: velocity to apply to the mobile boat
+        speed: magnitude of the applied velocity
+    """
+
+    angle = theta_targ - theta_mob
+    err = ((angle + math.pi) % (2 * math.pi) - math.pi) * flow_ori
+
+    r_des = r_targ + Kp * err * flow_dir
+
+    if abs(r_des - r_mob) < tolerance:
+        return 0.0, 0.0, 0.0
+
+    dir = 1.0 if r_des > r_mob else -1.0
+
+    return (
+        dir * vel_from_thrusters * math.cos(theta_mob),
+        dir * vel_from_thrusters * math.sin(theta_mob),
+        vel_from_thrusters,
+    )
+
+
+@njit(cache=True, fastmath=True)
+def naive_control_vel(
+    x_mob: float,
+    y_mob: float,
+    x_targ: float,
+    y_targ: float,
+    vel_from_thrusters: float,
+) -> tuple:
+    """
+    Control velocity of the naive controller, matching NaiveController.get_control_vel.
+
+    Outputs:
+        dx, dy: velocity to apply to the mobile boat
+        speed: magnitude of the applied velocity
+    """
+
+    head_to_targ = math.atan2(y_targ - y_mob, x_targ - x_mob)
+
+    return (
+        vel_from_thrusters * math.cos(head_to_targ),
+        vel_from_thrusters * math.sin(head_to_targ),
+        vel_from_thrusters,
+    )
+
+
+@njit(cache=True, fastmath=True)
+def evaluate_convergence(
+    dx: float,
+    dy: float,
+    convergence_threshold_sq: float,
+    convergence_count: int,
+    check_interval: int,
+) -> int:
+    """
+    Updates the count of consecutive converged steps, matching evaluate_convergence().
+    The first converged check is credited with check_interval steps that were not
+    observed, so convergence needs a count of convergence_count_threshold plus
+    check_interval.
+
+    Inputs:
+        dx, dy: displacement between the mobile and target boats
+        convergence_threshold_sq: squared distance within which the boats are
+                                  considered docked
+        convergence_count: count of consecutive converged steps before this one
+        check_interval: number of steps since the last check
+
+    Outputs:
+        convergence_count: updated count of consecutive converged steps
+    """
+
+    if dx * dx + dy * dy <= convergence_threshold_sq:
+        return convergence_count + check_interval
+
+    return 0
+
+
+@njit(cache=True, fastmath=True)
+def simulate_rankine(
+    boat_t: np.ndarray,
+    boat_x: np.ndarray,
+    boat_y: np.ndarray,
+    boat_th: np.ndarray,
+    boat_vel_flow_hist: np.ndarray,
+    boat_vel_comd_hist: np.ndarray,
+    boat_pose: np.ndarray,
+    strc_t: np.ndarray,
+    strc_x: np.ndarray,
+    strc_y: np.ndarray,
+    strc_th: np.ndarray,
+    strc_vel_flow_hist: np.ndarray,
+    strc_vel_comd_hist: np.ndarray,
+    strc_pose: np.ndarray,
+    timestep: float,
+    Gamma: float,
+    a: float,
+    noise_mu: float,
+    noise_sigma: float,
+    center_x: float,
+    center_y: float,
+    controller: int,
+    flow_ori: int,
+    flow_dir: int,
+    Kp: float,
+    vel_from_thrusters: float,
+    tolerance: float,
+    convergence_threshold: float,
+    convergence_count_threshold: float,
+    check_interval: int,
+    rk2: bool,
+) -> tuple:
+    """
+    Runs the time loop of simulation.run_simulation for a Rankine vortex, writing
+    directly into the preallocated histories of the mobile boat and the structure.
+    The current poses are carried in full precision, starting from boat_pose and
+    strc_pose and written back into them at the end, while the pose histories may be
+    stored in lower precision.
+
+    Swimmers are advanced with explicit Euler steps, like Swimmer.update, or with
+    explicit midpoint (RK2) steps if rk2 is set. The noise and control velocities
+    are held constant over each step, and the flow velocity recorded in the
+    histories is the one applied over the step.
+
+    Outputs:
+        life: index of the final pose in the histories
+        result: True if the boats converged
+        t: time at which the simulation ended
+        control_cost: distance traveled as a result of the control input
+    """
+
+    iters = boat_t.shape[0]
+    add_noise = noise_mu != 0.0 or noise_sigma != 0.0
+    centered = center_x == 0.0 and center_y == 0.0
+    omega_scale, omega_core = rankine_constants(Gamma, a)
+    convergence_threshold_sq = convergence_threshold * convergence_threshold
+    convergence_count_required = convergence_count_threshold + check_interval
+
+    x_boat, y_boat, th_boat = boat_pose[0], boat_pose[1], boat_pose[2]
+    x_strc, y_strc, th_strc = strc_pose[0], strc_pose[1], strc_pose[2]
+
+    life = 0
+    t = 0.0
+    result = False
+    control_cost = 0.0
+    convergence_count = 0
+
+    t_prev = 0.0
+    for ii in range(1, iters):
+        t = timestep * ii
+        dt = t - t_prev
+
+        # The controller and the convergence check use the poses at the start of
+        #   the step
+        x_mob = x_boat
+        y_mob = y_boat
+        x_targ = x_strc
+        y_targ = y_strc
+
+        # The vortex is centered at the origin, so the radii are shared with the
+        #   controller unless the GyreFlow was given a center.
+        r_mob = math.sqrt(x_mob * x_mob + y_mob * y_mob)
+        vx_mob, vy_mob = rankine_flow_at_radius(
+            x_mob, y_mob, r_mob, a, omega_scale, omega_core
+        )
+        noise_x = noise_y = vth_mob = 0.0
+
+        if add_noise:
+            noise_x = np.random.normal(noise_mu, noise_sigma)
+            noise_y = np.random.normal(noise_mu, noise_sigma)
+            vth_mob = np.random.normal(noise_mu, noise_sigma)
+
+        r_targ = math.sqrt(x_targ * x_targ + y_targ * y_targ)
+        theta_targ = math.atan2(y_targ, x_targ)
+
+        vx_targ, vy_targ = rankine_flow_at_radius(
+            x_targ, y_targ, r_targ, a, omega_scale, omega_core
+        )
+        noise_targ_x = noise_targ_y = vth_targ = 0.0
+
+        if add_noise:
+            noise_targ_x = np.random.normal(noise_mu, noise_sigma)
+            noise_targ_y = np.random.normal(noise_mu, noise_sigma)
+            vth_targ = np.random.normal(noise_mu, noise_sigma)
+
+        if rk2:
+            vx_targ, vy_targ = rk2_rankine_flow(
+                x_targ,
+                y_targ,
+                vx_targ + noise_targ_x,
+                vy_targ + noise_targ_y,
+                dt,
+                a,
+                omega_scale,
+                omega_core,
+            )
+        vx_targ += noise_targ_x
+        vy_targ += noise_targ_y
+
+        x_strc, y_strc, th_strc = update_swimmer(
+            strc_x,
+            strc_y,
+            strc_th,
+            strc_vel_flow_hist,
+            strc_vel_comd_hist,
+            life,
+            x_strc,
+            y_strc,
+            th_strc,
+            dt,
+            vx_targ,
+            vy_targ,
+            vth_targ,
+            0.0,
+            0.0,
+        )
+
+        if controller == CONTROLLER_NAIVE:
+            cont_vx, cont_vy, speed = naive_control_vel(
+                x_mob, y_mob, x_targ, y_targ, vel_from_thrusters
+            )
+        else:
+            if centered:
+                theta_mob = math.atan2(y_mob, x_mob)
+            else:
+                r_mob, theta_mob = get_state(x_mob, y_mob, center_x, center_y)
+                r_targ, theta_targ = get_state(x_targ, y_targ, center_x, center_y)
+            cont_vx, cont_vy, speed = fbrd_control_vel(
+                r_mob,
+                theta_mob,
+                r_targ,
+                theta_targ,
+                flow_ori,
+                flow_dir,
+                Kp,
+                vel_from_thrusters,
+                tolerance,
+            )
+
+        if rk2:
+            vx_mob, vy_mob = rk2_rankine_flow(
+                x_mob,
+                y_mob,
+                vx_mob + noise_x + cont_vx,
+                vy_mob + noise_y + cont_vy,
+                dt,
+                a,
+                omega_scale,
+                omega_core,
+            )
+        vx_mob += noise_x
+        vy_mob += noise_y
+
+        x_boat, y_boat, th_boat = update_swimmer(
+            boat_x,
+            boat_y,
+            boat_th,
+            boat_vel_flow_hist,
+            boat_vel_comd_hist,
+            life,
+            x_boat,
+            y_boat,
+            th_boat,
+            dt,
+            vx_mob,
+            vy_mob,
+            vth_mob,
+            cont_vx,
+            cont_vy,
+        )
+        life += 1
+        t_prev = t
+
+        # Sum up the cost as the distance traveled as a result of the control input.
+        control_cost += speed * timestep
+
+        if ii % check_interval != 0:
+            continue
+
+        convergence_count = evaluate_convergence(
+            x_mob - x_targ,
+            y_mob - y_targ,
+            convergence_threshold_sq,
+            convergence_count,
+            check_interval,
+        )
+        if convergence_count >= convergence_count_required:
+            result = True
+            break
+
+    boat_pose[0], boat_pose[1], boat_pose[2] = x_boat, y_boat, th_boat
+    strc_pose[0], strc_pose[1], strc_pose[2] = x_strc, y_strc, th_strc
+
+    fill_times(boat_t, boat_vel_flow_hist, boat_vel_comd_hist, life, timestep)
+    fill_times(strc_t, strc_vel_flow_hist, strc_vel_comd_hist, life, timestep)
+
+    return life, result, t, control_cost
+
+
+def compile_rankine(pose_dtype: type) -> None:
+    """
+    Compiles simulate_rankine, or loads it from the on-disk cache, by running a
+    single step with the argument types that simulation.run_simulation passes. Call
+    before forking worker processes so that they inherit the compiled kernel.
+
+    Inputs:
+        pose_dtype: dtype of the swimmers' pose histories, i.e. swimmer.POSE_DTYPE
+    """
+
+    swimmers = [
+        (
+            np.zeros(2),
+            np.zeros(2, dtype=pose_dtype),
+            np.zeros(2, dtype=pose_dtype),
+            np.zeros(2, dtype=pose_dtype),
+            np.zeros((2, 4)),
+            np.zeros((2, 4)),
+            np.ones(3),
+        )
+        for _ in range(2)
+    ]
+
+    simulate_rankine(
+        *swimmers[0],
+        *swimmers[1],
+        0.1,
+        1.0,
+        1.0,
+        0.0,
+        0.0,
+        0.0,
+        0.0,
+        CONTROLLER_FBRD,
+        1,
+        1,
+        1.0,
+        1.0,
+        1.0,
+        1.0,
+        1.0,
+        1,
+        False,
+    )
@@ -12,7 +12,7 @@ import numpy as np
 from mpl_toolkits import mplot3d
 
 import anglefunctions
-from simulation import SimulationOutput, SimulationParams, plot_result
+from simulation import SimulationOutput, SimulationParams, load_outputs, plot_result
 
 _FILENAME_PREFIX = "rankine_vortex_sim"
 _FILENAME_IDENTIFIER = "changing_radius"
@@ -23,23 +23,21 @@ def main():
 
     text_to_add = f"_{_FILENAME_IDENTIFIER}" if _FILENAME_IDENTIFIER is not None else ""
     filename_output_FBRD = (
-        f"{_FILENAME_PREFIX}{text_to_add}_FBRD_{_FILENAME_QTY}_outputs.pickle"
+        f"{_FILENAME_PREFIX}{text_to_add}_FBRD_{_FILENAME_QTY}_outputs.npy"
     )
     filename_output_Naive = (
-        f"{_FILENAME_PREFIX}{text_to_add}_Naive_{_FILENAME_QTY}_outputs.pickle"
+        f"{_FILENAME_PREFIX}{text_to_add}_Naive_{_FILENAME_QTY}_outputs.npy"
     )
     filename_params = (
         f"{_FILENAME_PREFIX}{text_to_add}_FBRD_{_FILENAME_QTY}_params.pickle"
     )
 
     print(f"Reading data from {filename_output_FBRD}...")
-    with open(filename_output_FBRD, "rb") as f:
-        outputs_FBRD = pickle.load(f)
+    outputs_FBRD = load_outputs(filename_output_FBRD)
     print(f"\tData imported.")
 
     print(f"Reading data from {filename_output_Naive}...")
-    with open(filename_output_Naive, "rb") as f:
-        outputs_Naive = pickle.load(f)
+    outputs_Naive = load_outputs(filename_output_Naive)
     print(f"\tData imported.")
 
     print(f"Reading data from {filename_params}...")
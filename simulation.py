@@ -1,10 +1,13 @@
+import multiprocessing
+import os
 import pickle
 import random
+import sys
 import time
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from functools import partial
-from multiprocessing import Pool
-from typing import Optional, Tuple
+from typing import Iterator, List, Optional, Tuple, Union
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -13,6 +16,7 @@ matplotlib.rcParams["text.usetex"] = True
 import numpy as np
 
 import animate
+import kernels
 from controller import FBRDController, NaiveController
 from flowfield import (
     FlowDirection,
@@ -23,10 +27,23 @@ from flowfield import (
     rankine_vortex,
     single_vortex,
 )
-from swimmer import Swimmer
+from swimmer import POSE_DTYPE, Swimmer
 
 
-@dataclass
+def _set_slots_state(obj: object, state: Union[dict, tuple]) -> None:
+    """
+    Restores a slotted dataclass from a pickle. Pickles made before the class had
+    __slots__ store the instance __dict__ rather than a (None, slots) tuple.
+    """
+
+    if isinstance(state, tuple):
+        state = state[1]
+
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+
+@dataclass(slots=True)
 class SimulationParams:
     """Class for setting up a convergence simulation"""
 
@@ -36,12 +53,15 @@ class SimulationParams:
     flow_dir: FlowDirection
     flow_ori: FlowOrientation
     flow_params: dict
-    gyre_center: np.ndarray = np.array((0, 0))
-    plot_limits: np.ndarray = np.array((-1, 1, -1, 1))
+    gyre_center: np.ndarray = field(default_factory=lambda: np.array((0, 0)))
+    plot_limits: np.ndarray = field(default_factory=lambda: np.array((-1, 1, -1, 1)))
     plot_step: float = 0.1
 
+    def __setstate__(self, state: Union[dict, tuple]) -> None:
+        _set_slots_state(self, state)
 
-@dataclass
+
+@dataclass(slots=True)
 class SimulationProblem:
     """Class for storing complete simulation problem"""
 
@@ -50,9 +70,10 @@ class SimulationProblem:
     struct_start_pos: np.ndarray
     id_number: int
     radius: Optional[float] = 0
+    summary_only: Optional[bool] = False  # Return a SimulationSummary
 
 
-@dataclass
+@dataclass(slots=True)
 class SimulationOutput:
     """Class for storing simulation results"""
 
@@ -64,12 +85,28 @@ class SimulationOutput:
     id_number: int
     control_cost: float
 
+    def __setstate__(self, state: Union[dict, tuple]) -> None:
+        _set_slots_state(self, state)
+
+
+@dataclass(slots=True)
+class SimulationSummary:
+    """Class for storing only the scalar results of a simulation"""
+
+    success: bool
+    success_time: float
+    id_number: int
+    control_cost: float
+    radius: float
+
 
 """PARAMETERS"""
 
 _CONTROLLER_TO_USE = FBRDController
 _NOISE_LEVEL_M_PER_S = 0.000
 _NUM_ITERS = 50
+_BATCH_SIMULATIONS = False
+_RANKINE_RK2 = False  # Integrate Rankine vortex simulations with RK2 rather than Euler
 _OUTPUT_NAME = "with_noise"
 
 
@@ -202,19 +239,21 @@ def run_simulation_many_rankine_vortex(output_name: Optional[str] = None) -> Non
 
     sim_results = []
     sim_outputs = np.zeros((ITERS, 2))
-    with Pool() as pool:
-        results = pool.imap_unordered(run_simulation, sim_problems)
-
-        for simulation_output, duration, _ in results:
-
-            sim_results.append(simulation_output)
-            sim_outputs[simulation_output.id_number - 1] = [
-                simulation_output.success,
-                simulation_output.success_time,
-            ]
-            print(
-                f"\tSimulation {simulation_output.id_number:03} finished in {duration:5.2f} s. Result: {simulation_output.success}"
-            )
+    if _BATCH_SIMULATIONS:
+        results = run_simulation_batch(sim_problems)
+    else:
+        results = run_simulation_parallel(sim_problems)
+
+    for simulation_output, duration, _ in results:
+
+        sim_results.append(simulation_output)
+        sim_outputs[simulation_output.id_number - 1] = [
+            simulation_output.success,
+            simulation_output.success_time,
+        ]
+        print(
+            f"\tSimulation {simulation_output.id_number:03} finished in {duration:5.2f} s. Result: {simulation_output.success}"
+        )
 
     print(f"Finished in {time.perf_counter() - time_start:0.2f} s")
 
@@ -226,10 +265,10 @@ def run_simulation_many_rankine_vortex(output_name: Optional[str] = None) -> Non
     file_name = f"{file_name_prefix}{text_to_add}_{ITERS}"
 
     with open(f"{file_name}_data.pickle", "wb") as f:
-        pickle.dump(sim_results, f)
+        pickle.dump(sim_results, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     with open(f"{file_name}_params.pickle", "wb") as f:
-        pickle.dump(sim_params, f)
+        pickle.dump(sim_params, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     print("Data pickled.")
 
@@ -309,7 +348,12 @@ def run_simulation_many_rankine_vortex_changing_radius(
 
             sim_problems.append(
                 SimulationProblem(
-                    sim_params, modboat_pt, struct_pt, r_count * ITERS + ii, RADIUS
+                    sim_params,
+                    modboat_pt,
+                    struct_pt,
+                    r_count * ITERS + ii,
+                    RADIUS,
+                    summary_only=True,
                 )
             )
 
@@ -324,23 +368,22 @@ def run_simulation_many_rankine_vortex_changing_radius(
     # sim_results = []
     sim_outputs = np.zeros((TOTAL_ITERS, 4))
 
-    with Pool(processes=40) as pool:
-        results = pool.imap_unordered(run_simulation, sim_problems)
-
-        for simulation_output, duration, radius in results:
-
-            # sim_results.append(simulation_output)
-            sim_outputs[simulation_output.id_number - 1] = [
-                simulation_output.success,
-                simulation_output.success_time,
-                radius,
-                simulation_output.control_cost,
-            ]
-            print(
-                f"\tSimulation {simulation_output.id_number:03}"
-                f" from radius: {radius:0.2}"
-                f" finished in {duration:5.2f} s. Result: {simulation_output.success}"
-            )
+    results = run_simulation_parallel(sim_problems, max_workers=40)
+
+    for simulation_output, duration, radius in results:
+
+        # sim_results.append(simulation_output)
+        sim_outputs[simulation_output.id_number - 1] = [
+            simulation_output.success,
+            simulation_output.success_time,
+            radius,
+            simulation_output.control_cost,
+        ]
+        print(
+            f"\tSimulation {simulation_output.id_number:03}"
+            f" from radius: {radius:0.2}"
+            f" finished in {duration:5.2f} s. Result: {simulation_output.success}"
+        )
 
     print(f"Finished in {time.perf_counter() - time_start:0.2f} s")
 
@@ -352,19 +395,68 @@ def run_simulation_many_rankine_vortex_changing_radius(
     file_name = f"{file_name_prefix}{text_to_add}_{ITERS}"
 
     # with open(f"{file_name}_data.pickle", "wb") as f:
-    # pickle.dump(sim_results, f)
+    # pickle.dump(sim_results, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-    with open(f"{file_name}_outputs.pickle", "wb") as f:
-        pickle.dump(sim_outputs, f)
+    # The outputs are a plain array, so save them in numpy's own format
+    np.save(f"{file_name}_outputs.npy", sim_outputs)
 
     with open(f"{file_name}_params.pickle", "wb") as f:
-        pickle.dump(sim_params, f)
+        pickle.dump(sim_params, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     print("Data pickled.")
 
 
-def run_simulation(sim_problem: SimulationProblem) -> Tuple[SimulationOutput, float]:
-    """Implements a single simulation"""
+def load_outputs(file_name: str) -> np.ndarray:
+    """
+    Loads the summary outputs saved by a simulation sweep. Falls back to the
+    `_outputs.pickle` file written by earlier versions if the `.npy` file is missing.
+
+    Inputs:
+        file_name: path of the `_outputs.npy` file
+
+    Outputs:
+        sim_outputs: numpy array of summary data, one row per simulation
+    """
+
+    if not os.path.exists(file_name) and file_name.endswith(".npy"):
+        with open(f"{file_name[:-len('.npy')]}.pickle", "rb") as f:
+            return pickle.load(f)
+
+    return np.load(file_name)
+
+
+def run_simulation_parallel(
+    sim_problems: List[SimulationProblem], max_workers: Optional[int] = None
+) -> Iterator[Tuple[Union[SimulationOutput, SimulationSummary], float, float]]:
+    """
+    Runs simulations across a pool of worker processes, yielding the results of
+    run_simulation() in the order of the problems.
+
+    Workers are forked on Linux so they start without re-importing this module, and
+    problems are sent in chunks of several at a time. The Rankine kernel is compiled
+    once here, before the workers start, rather than in every worker.
+    """
+
+    if any(p.simulation_params.flow_model is rankine_vortex for p in sim_problems):
+        kernels.compile_rankine(POSE_DTYPE)
+
+    context = multiprocessing.get_context(
+        "fork" if sys.platform.startswith("linux") else "spawn"
+    )
+    max_workers = max_workers or os.cpu_count()
+    chunksize = max(1, len(sim_problems) // (4 * max_workers))
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        yield from pool.map(run_simulation, sim_problems, chunksize=chunksize)
+
+
+def run_simulation(
+    sim_problem: SimulationProblem,
+) -> Tuple[Union[SimulationOutput, SimulationSummary], float, float]:
+    """
+    Implements a single simulation. Returns only a SimulationSummary if the problem
+    asks for it, which keeps the result small when sent between processes.
+    """
 
     time_start = time.perf_counter()
 
@@ -372,49 +464,341 @@ def run_simulation(sim_problem: SimulationProblem) -> Tuple[SimulationOutput, fl
     sim_params = sim_problem.simulation_params
     initial_modboat_pos = sim_problem.modboat_start_pos
     initial_structure_pos = sim_problem.struct_start_pos
+    id_number = sim_problem.id_number
+    radius = sim_problem.radius
+    timestep_s = sim_params.timestep_s
+    flow_model = sim_params.flow_model
 
     # Simulation setup
-    iters = int(sim_params.total_time_s / sim_params.timestep_s)
+    iters = int(sim_params.total_time_s / timestep_s)
     boat = Swimmer(initial_modboat_pos, iters)
     strc = Swimmer(initial_structure_pos, iters)
-    flow = GyreFlow(flow_model=sim_params.flow_model, **sim_params.flow_params)
+    flow = GyreFlow(flow_model=flow_model, **sim_params.flow_params)
     cont = _CONTROLLER_TO_USE(
-        flow, sim_params.flow_ori, sim_params.flow_dir, sim_params.timestep_s
+        flow, sim_params.flow_ori, sim_params.flow_dir, timestep_s
     )
 
+    # The Rankine vortex is simulated by a compiled kernel; other flows use the
+    #   reference loop below.
+    if flow_model is rankine_vortex:
+        result, t, control_cost = run_simulation_rankine(
+            boat, strc, flow, cont, sim_params
+        )
+    else:
+        result, t, control_cost = run_simulation_loop(
+            boat, strc, flow, cont, sim_params
+        )
+
+    if sim_problem.summary_only:
+        output = SimulationSummary(result, t, id_number, control_cost, radius)
+    else:
+        output = SimulationOutput(boat, strc, flow, result, t, id_number, control_cost)
+
+    return output, time.perf_counter() - time_start, radius
+
+
+def run_simulation_loop(
+    boat: Swimmer,
+    strc: Swimmer,
+    flow: GyreFlow,
+    cont: FBRDController,
+    sim_params: SimulationParams,
+) -> Tuple[bool, float, float]:
+    """
+    Runs the time loop of a single simulation step-by-step in Python. Supports any
+    flow model.
+
+    Outputs:
+        result: True if the boats converged
+        t: time at which the simulation ended
+        control_cost: distance traveled as a result of the control input
+    """
+
     result = False
     control_cost = 0
 
+    # Bind the per-step functions and parameters once rather than looking them up
+    #   on every step
+    flow_func = flow.flow_func_scalar
+    get_control_vel = cont.get_control_vel
+    evaluate_convergence = cont.evaluate_convergence
+    check_interval = cont.check_interval
+    update_boat = boat.update
+    update_strc = strc.update
+    get_boat_pose = boat.get_pose
+    get_strc_pose = strc.get_pose
+
+    # Track the current positions as scalars rather than slicing the histories
+    px, py, _ = get_boat_pose()
+    sx, sy, _ = get_strc_pose()
+
+    # Times are computed as ii * dt rather than accumulated to avoid drift
+    dt = sim_params.timestep_s
+
     # Run simulation
-    for ii in range(1, iters):
-        t = sim_params.timestep_s * ii
+    for ii in range(1, boat.lifespan):
+        t = ii * dt
 
-        pos_modboat = boat.get_pose()[0:2]
-        pos_structure = strc.get_pose()[0:2]
+        vel_modboat = flow_func(px, py)
+        vel_structure = flow_func(sx, sy)
 
-        vel_modboat = flow.flow_func(pos_modboat)
-        vel_structure = flow.flow_func(pos_structure)
+        vel_control, new_cost = get_control_vel((px, py), (sx, sy))
 
-        vel_control = cont.get_control_vel(pos_modboat, pos_structure)
+        update_boat(t, vel_modboat, vel_control)
+        update_strc(t, vel_structure)
 
-        boat.update(t, vel_modboat, vel_control)
-        strc.update(t, vel_structure)
+        px, py, _ = get_boat_pose()
+        sx, sy, _ = get_strc_pose()
 
         # Sum up the cost as the distance traveled as a result of the control input.
-        new_cost = np.linalg.norm(vel_control) * sim_params.timestep_s
         control_cost += new_cost
 
-        if cont.evaluate_convergence():
+        if ii % check_interval == 0 and evaluate_convergence():
             result = True
             break
 
-    return (
-        SimulationOutput(
-            boat, strc, flow, result, t, sim_problem.id_number, control_cost
-        ),
-        time.perf_counter() - time_start,
-        sim_problem.radius,
+    return result, t, control_cost
+
+
+def run_simulation_rankine(
+    boat: Swimmer,
+    strc: Swimmer,
+    flow: GyreFlow,
+    cont: FBRDController,
+    sim_params: SimulationParams,
+) -> Tuple[bool, float, float]:
+    """
+    Runs the time loop of a single simulation in a Rankine vortex using the compiled
+    kernel, which writes directly into the swimmers' histories.
+
+    Outputs:
+        result: True if the boats converged
+        t: time at which the simulation ended
+        control_cost: distance traveled as a result of the control input
+    """
+
+    noise = sim_params.flow_params.get("noise", np.array((0, 0)))
+    controller = (
+        kernels.CONTROLLER_NAIVE
+        if isinstance(cont, NaiveController)
+        else kernels.CONTROLLER_FBRD
+    )
+
+    # Current poses, which the kernel advances in place
+    boat_pose = np.array(boat.get_pose())
+    strc_pose = np.array(strc.get_pose())
+
+    life, result, t, control_cost = kernels.simulate_rankine(
+        boat.t,
+        boat.x,
+        boat.y,
+        boat.th,
+        boat.vel_flow_hist,
+        boat.vel_comd_hist,
+        boat_pose,
+        strc.t,
+        strc.x,
+        strc.y,
+        strc.th,
+        strc.vel_flow_hist,
+        strc.vel_comd_hist,
+        strc_pose,
+        float(sim_params.timestep_s),
+        float(sim_params.flow_params["Gamma"]),
+        float(sim_params.flow_params["a"]),
+        float(noise[0]),
+        float(noise[1]),
+        float(flow.center[0]),
+        float(flow.center[1]),
+        controller,
+        cont.flow_ori.value,
+        cont.flow_dir.value,
+        float(cont.Kp),
+        float(cont.vel_from_thrusters),
+        float(cont.tolerance),
+        float(cont.convergence_threshold),
+        float(cont.convergence_count_threshold),
+        cont.check_interval,
+        _RANKINE_RK2,
     )
+    boat.set_life(life, boat_pose)
+    strc.set_life(life, strc_pose)
+
+    return result, t, control_cost
+
+
+def run_simulation_batch(
+    sim_problems: List[SimulationProblem],
+) -> List[Tuple[SimulationOutput, float, float]]:
+    """
+    Implements many simulations that share the same SimulationParams at once,
+    advancing all of them together with vectorized numpy operations. Simulations
+    that converge are dropped from the working set.
+
+    Supports any flow model that accepts vectors of points.
+
+    Outputs:
+        results: (output, duration, radius) for each problem, in the order given
+    """
+
+    time_start = time.perf_counter()
+
+    sim_params = sim_problems[0].simulation_params
+    if any(p.simulation_params is not sim_params for p in sim_problems):
+        raise ValueError("Batched simulations must share the same SimulationParams")
+
+    # Simulation setup
+    n = len(sim_problems)
+    timestep_s = sim_params.timestep_s
+    iters = int(sim_params.total_time_s / timestep_s)
+    flow = GyreFlow(flow_model=sim_params.flow_model, **sim_params.flow_params)
+    cont = _CONTROLLER_TO_USE(
+        flow, sim_params.flow_ori, sim_params.flow_dir, timestep_s
+    )
+
+    # Histories of all swimmers, [iters, n, [t, dx, dy, dtheta]] for velocities and
+    #   [iters, n, [x, y, theta]] for poses, which share the times in pose_times.
+    #   Each Swimmer gets a view of its own column.
+    hists = {
+        name: np.zeros((iters, n, 4))
+        for name in (
+            "boat_vel_flow",
+            "boat_vel_comd",
+            "strc_vel_flow",
+            "strc_vel_comd",
+        )
+    }
+    for name in ("boat_pose", "strc_pose"):
+        hists[name] = np.zeros((iters, n, 3), dtype=POSE_DTYPE)
+    pose_times = np.zeros((iters, n))
+
+    # Current poses in full precision
+    start_mob = np.array([p.modboat_start_pos for p in sim_problems], dtype=float)
+    start_str = np.array([p.struct_start_pos for p in sim_problems], dtype=float)
+    hists["boat_pose"][0] = start_mob
+    hists["strc_pose"][0] = start_str
+
+    result = np.zeros(n, dtype=bool)
+    end_time = np.zeros(n)
+    end_life = np.zeros(n, dtype=int)
+    durations = np.zeros(n)
+    control_cost = np.zeros(n)
+    convergence_count = np.zeros(n)
+
+    # Working set of the simulations that are still running
+    active = np.arange(n)
+    pose_mob = start_mob.copy()
+    pose_str = start_str.copy()
+    end_pose_mob = start_mob.copy()
+    end_pose_str = start_str.copy()
+
+    # Run simulations
+    t = t_prev = 0.0
+    for ii in range(1, iters):
+        t = timestep_s * ii
+        dt = t - t_prev
+        t_prev = t
+
+        vel_modboat = flow.flow_func(pose_mob.T).T
+        vel_structure = flow.flow_func(pose_str.T).T
+        vel_control, new_cost = cont.get_control_vel_batch(
+            pose_mob[:, 0:2], pose_str[:, 0:2]
+        )
+
+        for name, vel in (
+            ("boat_vel_flow", vel_modboat),
+            ("boat_vel_comd", vel_control),
+            ("strc_vel_flow", vel_structure),
+        ):
+            hists[name][ii - 1, active, 1:] = vel
+
+        # Convergence is evaluated on the poses at the start of the step
+        dx = pose_mob[:, 0] - pose_str[:, 0]
+        dy = pose_mob[:, 1] - pose_str[:, 1]
+
+        pose_mob = pose_mob + (vel_modboat + vel_control) * dt
+        pose_str = pose_str + vel_structure * dt
+        hists["boat_pose"][ii, active] = pose_mob
+        hists["strc_pose"][ii, active] = pose_str
+
+        # Sum up the cost as the distance traveled as a result of the control input.
+        control_cost[active] += new_cost
+
+        if ii % cont.check_interval != 0:
+            continue
+
+        counts = np.where(
+            dx * dx + dy * dy <= cont.convergence_threshold_sq,
+            convergence_count[active] + cont.check_interval,
+            0,
+        )
+        convergence_count[active] = counts
+
+        # The first converged check is credited with check_interval steps that were
+        #   not observed, so require one more interval than the threshold.
+        done = counts >= cont.convergence_count_threshold + cont.check_interval
+        if np.any(done):
+            finished = active[done]
+            result[finished] = True
+            end_time[finished] = t
+            end_life[finished] = ii
+            durations[finished] = time.perf_counter() - time_start
+            end_pose_mob[finished] = pose_mob[done]
+            end_pose_str[finished] = pose_str[done]
+
+            keep = ~done
+            active = active[keep]
+            pose_mob = pose_mob[keep]
+            pose_str = pose_str[keep]
+
+            if active.size == 0:
+                break
+
+    end_time[active] = t
+    end_life[active] = ii
+    durations[active] = time.perf_counter() - time_start
+    end_pose_mob[active] = pose_mob
+    end_pose_str[active] = pose_str
+
+    # Fill the time columns of the histories in one pass per simulation
+    times = timestep_s * np.arange(iters)
+    for kk, life in enumerate(end_life):
+        pose_times[1 : life + 1, kk] = times[1 : life + 1]
+        for name in hists:
+            if not name.endswith("_pose"):
+                hists[name][:life, kk, 0] = times[1 : life + 1]
+
+    results = []
+    for kk, sim_problem in enumerate(sim_problems):
+        boat = Swimmer(sim_problem.modboat_start_pos, iters)
+        strc = Swimmer(sim_problem.struct_start_pos, iters)
+        for swimmer, prefix, end_pose in (
+            (boat, "boat", end_pose_mob),
+            (strc, "strc", end_pose_str),
+        ):
+            swimmer.t = pose_times[:, kk]
+            swimmer.x, swimmer.y, swimmer.th = hists[f"{prefix}_pose"][:, kk].T
+            swimmer.vel_flow_hist = hists[f"{prefix}_vel_flow"][:, kk]
+            swimmer.vel_comd_hist = hists[f"{prefix}_vel_comd"][:, kk]
+            swimmer.set_life(end_life[kk], end_pose[kk])
+
+        results.append(
+            (
+                SimulationOutput(
+                    boat,
+                    strc,
+                    flow,
+                    bool(result[kk]),
+                    end_time[kk],
+                    sim_problem.id_number,
+                    control_cost[kk],
+                ),
+                durations[kk],
+                sim_problem.radius,
+            )
+        )
+
+    return results
 
 
 def plot_result(
@@ -439,10 +823,10 @@ def plot_result(
     if traj_only:
         fig, ax = plt.subplots()
 
-        max_x_modboat = np.max(np.abs(sim_out.modboat.pose_hist[:, 1]))
-        max_y_modboat = np.max(np.abs(sim_out.modboat.pose_hist[:, 2]))
-        max_x_lattice = np.max(np.abs(sim_out.struct.pose_hist[:, 1]))
-        max_y_lattice = np.max(np.abs(sim_out.struct.pose_hist[:, 2]))
+        max_x_modboat = np.max(np.abs(sim_out.modboat.x))
+        max_y_modboat = np.max(np.abs(sim_out.modboat.y))
+        max_x_lattice = np.max(np.abs(sim_out.struct.x))
+        max_y_lattice = np.max(np.abs(sim_out.struct.y))
 
         maxCoord = np.max(
             np.array((max_x_modboat, max_y_modboat, max_x_lattice, max_y_lattice))
@@ -2,13 +2,18 @@
 A module that defines Swimmer() objects - point mass particles that exist in a 2D flow.
 """
 
-from typing import Optional
+from typing import Optional, Sequence, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 from flowfield import GyreFlow
 
+# Precision of the stored pose histories. Single precision is plenty for plotting and
+#   halves the memory of long simulations; the current pose and the integration are
+#   always kept in double precision.
+POSE_DTYPE = np.float32
+
 
 class Swimmer:
     """Defines a point-mass swimmer with 2D position and orientation"""
@@ -25,22 +30,65 @@ class Swimmer:
         self.life = 0
         self.lifespan = lifespan
 
-        self.pose_hist = np.zeros((self.lifespan, 4))  # [t, x, y, theta]
-        self.pose_hist[0, 1:] = pose
+        # Current pose (x, y, theta) in full precision
+        self.pose = (float(pose[0]), float(pose[1]), float(pose[2]))
+
+        # Pose history [t, x, y, theta], stored as one array per component. Times
+        #   stay in double precision so that long simulations can resolve each step.
+        self.t = np.zeros(self.lifespan)
+        self.x = np.zeros(self.lifespan, dtype=POSE_DTYPE)
+        self.y = np.zeros(self.lifespan, dtype=POSE_DTYPE)
+        self.th = np.zeros(self.lifespan, dtype=POSE_DTYPE)
+        self.x[0], self.y[0], self.th[0] = self.pose
 
         self.vel_flow_hist = np.zeros((self.lifespan, 4))  # [t, dx, dy, dtheta]
         self.vel_comd_hist = np.zeros((self.lifespan, 4))
 
-    def get_pose(self) -> np.ndarray:
-        """Returns the current pose of the swimmer"""
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restores swimmers pickled with a single (lifespan x 4) pose_hist array or
+        without a separate current pose.
+        """
+
+        pose_hist = state.pop("pose_hist", None)
+        self.__dict__.update(state)
+
+        if pose_hist is not None:
+            self.t, self.x, self.y, self.th = (col.copy() for col in pose_hist.T)
+
+        if "pose" not in state:
+            life = self.life
+            self.pose = (float(self.x[life]), float(self.y[life]), float(self.th[life]))
+
+    @property
+    def pose_hist(self) -> np.ndarray:
+        """Pose history as a (lifespan x [t, x, y, theta]) array, assembled on access"""
+
+        return np.column_stack((self.t, self.x, self.y, self.th))
 
-        return self.pose_hist[self.life, 1:]
+    def get_pose(self) -> Tuple[float, float, float]:
+        """Returns the current pose (x, y, theta) of the swimmer"""
+
+        return self.pose
+
+    def set_life(self, life: int, pose: Sequence[float]) -> None:
+        """
+        Sets the current step and pose after the histories have been filled
+        externally, e.g. by a compiled kernel.
+
+        Inputs:
+            life: index of the current pose in the histories
+            pose: current pose [x, y, theta] in full precision
+        """
+
+        self.life = life
+        self.pose = (float(pose[0]), float(pose[1]), float(pose[2]))
 
     def update(
         self,
         t: float,
-        vel: np.ndarray,
-        cont_vel: Optional[np.ndarray] = np.array((0, 0, 0)),
+        vel: Sequence[float],
+        cont_vel: Optional[Sequence[float]] = (0.0, 0.0, 0.0),
     ) -> None:
         """
         Updates the position of the swimmer given a velocity and time.
@@ -48,32 +96,43 @@ class Swimmer:
 
         Inputs:
             t: time at the update step
-            vel: numpy 2D velocity [xdot, ydot, thetadot]
+            vel: 3-long velocity [xdot, ydot, thetadot]
             cont_vel: optional velocity imparted by a controller [xdot, ydot, thetadot]
 
         """
 
-        if self.life >= self.lifespan - 1:
+        life = self.life
+        if life >= self.lifespan - 1:
             raise IndexError("Simulation has gone on too long...")
 
-        # If vel = [dx, dy] -> use vel = [dx, dy, 0]
-        if len(vel) == 2:
-            vel = np.hstack((vel, 0))
+        vx, vy, vth = vel[0], vel[1], vel[2]
+        cx, cy, cth = cont_vel[0], cont_vel[1], cont_vel[2]
 
         # Save velocities
-        self.vel_flow_hist[self.life, 0] = t
-        self.vel_flow_hist[self.life, 1:] = vel
-        self.vel_comd_hist[self.life, 0] = t
-        self.vel_comd_hist[self.life, 1:] = cont_vel
+        self.vel_flow_hist[life, 0] = t
+        self.vel_flow_hist[life, 1] = vx
+        self.vel_flow_hist[life, 2] = vy
+        self.vel_flow_hist[life, 3] = vth
+        self.vel_comd_hist[life, 0] = t
+        self.vel_comd_hist[life, 1] = cx
+        self.vel_comd_hist[life, 2] = cy
+        self.vel_comd_hist[life, 3] = cth
 
         # Time difference
-        dt = t - self.pose_hist[self.life, 0]
+        dt = t - self.t[life]
+
+        x, y, th = self.pose
+        x += (vx + cx) * dt
+        y += (vy + cy) * dt
+        th += (vth + cth) * dt
+        self.pose = (x, y, th)
 
-        newPose = self.pose_hist[self.life, 1:] + (vel + cont_vel) * dt
+        self.t[life + 1] = t
+        self.x[life + 1] = x
+        self.y[life + 1] = y
+        self.th[life + 1] = th
 
-        self.life += 1
-        self.pose_hist[self.life, 0] = t
-        self.pose_hist[self.life, 1:] = newPose
+        self.life = life + 1
 
     def plot(self, ax: plt.Axes, *args, **kwargs) -> None:
         """
@@ -85,12 +144,13 @@ class Swimmer:
                              directly along to the plot command
         """
 
-        traj = self.pose_hist[: self.life + 1, 1:3]
-        ax.plot(traj[:, 0], traj[:, 1], *args, **kwargs)
+        xs = self.x[: self.life + 1]
+        ys = self.y[: self.life + 1]
+        ax.plot(xs, ys, *args, **kwargs)
 
         label = kwargs.pop("label", None)
-        ax.plot(traj[0, 0], traj[0, 1], *args, marker="o", **kwargs)
-        # ax.plot(traj[-1, 0], traj[-1, 1], *args, marker="s", **kwargs)
+        ax.plot(xs[0], ys[0], *args, marker="o", **kwargs)
+        # ax.plot(xs[-1], ys[-1], *args, marker="s", **kwargs)
 
         plt.draw()
 
@@ -106,8 +166,8 @@ class Swimmer:
 
         flow_model: GyreFlow = kwargs.pop("flow_model")
 
-        ts = self.pose_hist[: self.life + 1, 0]
-        traj = self.pose_hist[: self.life + 1, 1:3]
+        ts = self.t[: self.life + 1]
+        traj = np.column_stack((self.x[: self.life + 1], self.y[: self.life + 1]))
         _, phases = flow_model.get_state(traj)
 
         ax.plot(ts, phases, *args, **kwargs)
@@ -125,8 +185,8 @@ class Swimmer:
 
         flow_model: GyreFlow = kwargs.pop("flow_model")
 
-        ts = self.pose_hist[: self.life + 1, 0]
-        traj = self.pose_hist[: self.life + 1, 1:3]
+        ts = self.t[: self.life + 1]
+        traj = np.column_stack((self.x[: self.life + 1], self.y[: self.life + 1]))
         rs, _ = flow_model.get_state(traj)
 
         ax.plot(ts, rs, *args, **kwargs)